@@ -166,9 +166,9 @@ Configuration (config.yml):
 
 # Slack parameters
 _SYSTEM_WARNING = """Critical warning: {uname} memory usage high: {available:.1f}GB of {total:.1f}GB available ({percentage:.2f}%)."""
-_TERMINATE_WARNING = """\n\nTerminated {user}'s process group {pgid} and freed {memory:.1f}GB ({percentage:.2f}%) of RAM."""
+_TERMINATE_WARNING = """\n\nTerminated {user}'s process group {pgid} and freed {memory:.1f}GB ({percentage:.2f}%) of RAM and {swap:.1f}GB of swap."""
 _IDLE_MESSAGE = """has been idle since {last_cpu} ({idle_hours:.1f} hours ago) and """
-_USER_WARNING = """Warning: {user}'s process group {pgid} {idle_message}is using {memory:.1f}GB ({percentage:.2f}%) of RAM. Kill it with `kill -- -{pgid}`."""
+_USER_WARNING = """Warning: {user}'s process group {pgid} {idle_message}is using {anon_swap:.1f}GB ({percentage:.2f}%) of anonymous memory and swap ({memory:.1f}GB of RAM, {swap:.1f}GB of swap). Kill it with `kill -- -{pgid}`."""
 
 
 def send_mail(subject, message):
@@ -179,25 +179,55 @@ def format_time(t):
     return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t))
 
 
+# smaps fields collected per pid, mapped to data frame columns
+_SMAPS_FIELDS = {
+    "Pss": "memory",
+    "SwapPss": "swap",
+    "Pss_Anon": "anon",
+    "Pss_File": "file",
+    "Pss_Shmem": "shmem",
+}
+
+
 def fetch_pid_memory_usage(pid):
     # add 0.5KB as average error due to truncation
     pss_adjust = 0.5
-    pss = 0
-    try:
-        with open("/proc/{}/smaps".format(pid), "r") as smaps:
-            for line in smaps:
-                if line.startswith("Pss"):
-                    pss += int(line.split(" ")[-2]) + pss_adjust
-    except (FileNotFoundError, ProcessLookupError, PermissionError):
-        pass
-    return pss
+    usage = {column: 0 for column in _SMAPS_FIELDS.values()}
+    breakdown = False
+    for smaps_file in ["smaps_rollup", "smaps"]:
+        try:
+            with open("/proc/{}/{}".format(pid, smaps_file), "r") as smaps:
+                for line in smaps:
+                    field, _, value = line.partition(":")
+                    try:
+                        column = _SMAPS_FIELDS[field]
+                    except KeyError:
+                        continue
+                    value = int(value.split()[0])
+                    if value > 0:
+                        usage[column] += value + pss_adjust
+                    breakdown = breakdown or field.startswith("Pss_")
+            break
+        except FileNotFoundError:
+            # smaps_rollup requires Linux 4.14
+            continue
+        except (ProcessLookupError, PermissionError):
+            break
+    if not breakdown:
+        # Pss_Anon etc. require Linux 5.0, assume all memory is anonymous
+        usage["anon"] = usage["memory"]
+    return usage
 
 
 class ProcessGroup:
-    def __init__(self, pgid, user, cputime, memory):
+    def __init__(self, pgid, user, cputime, memory, swap=0, anon=0, file=0, shmem=0):
         self.pgid = pgid
         self.user = user
         self.memory = memory
+        self.swap = swap
+        self.anon = anon
+        self.file = file
+        self.shmem = shmem
         self.cputime = cputime
         self.cputime_since_update = 0
         self.start_time = time.time()
@@ -223,6 +253,20 @@ class ProcessGroup:
     def memory_percent(self):
         return self.memory_fraction * 100
 
+    @property
+    def anon_swap_memory(self):
+        # memory freed by terminating the group, whether resident or swapped
+        return self.anon + self.swap
+
+    @property
+    def anon_swap_fraction(self):
+        global _TOTAL_MEMORY
+        return self.anon_swap_memory / _TOTAL_MEMORY
+
+    @property
+    def anon_swap_percent(self):
+        return self.anon_swap_fraction * 100
+
     def recently_warned(self, timeout):
         global _WARNING_COOLDOWN
         global _HOUR
@@ -232,9 +276,13 @@ class ProcessGroup:
             since_last_warning = time.time() - self.last_warning
             return since_last_warning <= max(timeout * _HOUR, _WARNING_COOLDOWN)
 
-    def update(self, cputime, memory):
+    def update(self, cputime, memory, swap=0, anon=0, file=0, shmem=0):
         global _ACTIVE_USAGE
         self.memory = memory
+        self.swap = swap
+        self.anon = anon
+        self.file = file
+        self.shmem = shmem
         self.cputime_since_update = max(cputime - self.cputime, 0)
         if self.cputime_since_update > _ACTIVE_USAGE * _UPDATE:
             self.last_cpu_time = time.time()
@@ -243,8 +291,8 @@ class ProcessGroup:
     def check(self):
         global _IDLE_TIMEOUT_HOURS
         cutoffs = np.array(list(_IDLE_TIMEOUT_HOURS.keys()))
-        if self.memory_fraction > np.min(cutoffs):
-            cutoff = np.max(cutoffs[cutoffs < self.memory_fraction])
+        if self.anon_swap_fraction > np.min(cutoffs):
+            cutoff = np.max(cutoffs[cutoffs < self.anon_swap_fraction])
             timeout = _IDLE_TIMEOUT_HOURS[cutoff]
             if self.idle_hours > timeout:
                 if not self.recently_warned(timeout):
@@ -283,8 +331,10 @@ class ProcessGroup:
             user=self.user,
             pgid=self.pgid,
             idle_message=idle_message,
+            anon_swap=self.anon_swap_memory,
+            percentage=self.anon_swap_percent,
             memory=self.memory,
-            percentage=self.memory_percent,
+            swap=self.swap,
         )
 
     def warn(self):
@@ -307,8 +357,8 @@ class ProcessGroup:
             idle_str = "idle for {:.2f} hours".format(self.idle_hours)
         else:
             idle_str = "active"
-        return "PGID {} ({}), memory {:.1f}GB ({:.2f}%), {}".format(
-            self.pgid, self.user, self.memory, self.memory_percent, idle_str
+        return "PGID {} ({}), memory {:.1f}GB ({:.2f}%), swap {:.1f}GB, {}".format(
+            self.pgid, self.user, self.memory, self.memory_percent, self.swap, idle_str
         )
 
 
@@ -321,13 +371,28 @@ class MemoryMonitor:
     def init_logfile(self):
         if _LOG_ACTIVE:
             self.logfile = _LOG_FILENAME
+            headers = ["date", "time", "cpu", "ram", "swap"]
+            for i in range(_N_GPU):
+                headers += ["gpu{}_util".format(i), "gpu{}_ram".format(i)]
+            if os.path.isfile(self.logfile):
+                with open(self.logfile, "r") as handle:
+                    existing_headers = handle.readline().rstrip("\n").split("\t")
+                if existing_headers != headers:
+                    # log format has changed, move the old log aside
+                    self.rotate_logfile()
             if not os.path.isfile(self.logfile):
                 with open(self.logfile, "w") as handle:
-                    headers = ["date", "time", "cpu", "ram"]
-                    for i in range(_N_GPU):
-                        headers += ["gpu{}_util".format(i), "gpu{}_ram".format(i)]
                     print("\t".join(headers), file=handle)
 
+    def rotate_logfile(self):
+        root, ext = os.path.splitext(self.logfile)
+        i = 1
+        while os.path.exists("{}_{}{}".format(root, i, ext)):
+            i += 1
+        rotated = "{}_{}{}".format(root, i, ext)
+        os.rename(self.logfile, rotated)
+        print("Log format changed, moved {} to {}".format(self.logfile, rotated))
+
     def check_superuser(self):
         superuser = os.geteuid() == 0
         if not superuser:
@@ -363,20 +428,21 @@ class MemoryMonitor:
         df["pid"] = df["pid"].values.astype(int)
         df["rss"] = df["rss"].values.astype(int)
         df["cputime"] = df["cputime"].values.astype(float)
-        # pre-filter
-        df = df.loc[df["rss"] > 0]
-        df["memory"] = (
-            np.array([fetch_pid_memory_usage(pid) for pid in df["pid"]])
-            * _KILOBYTE
-            / _GIGABYTE
-        )
-        # filter
-        df = df.loc[df["memory"] > 0]
+        # pre-filter; fully swapped out processes have no rss, so filter on user
         df = df.loc[df["user"] != "root"]
         df = df.loc[df["user"] != "sddm"]
+        columns = list(_SMAPS_FIELDS.values())
+        usage = pd.DataFrame(
+            [fetch_pid_memory_usage(pid) for pid in df["pid"]],
+            index=df.index,
+            columns=columns,
+        )
+        df[columns] = usage.values * _KILOBYTE / _GIGABYTE
+        # filter
+        df = df.loc[(df["memory"] > 0) | (df["swap"] > 0)]
         # sum over process groups
         df = (
-            df[["pgid", "user", "cputime", "memory"]]
+            df[["pgid", "user", "cputime"] + columns]
             .groupby(["pgid", "user"])
             .agg(np.sum)
             .reset_index()
@@ -400,6 +466,7 @@ class MemoryMonitor:
         )
         # total system memory memory
         system_mem = {fn: 0 for fn in fieldnames}
+        system_mem.update({"swap_total": 0, "swap_used": 0, "swap_free": 0})
         for curr_mem in reader:
             for k, v in curr_mem.items():
                 if k == "source":
@@ -407,10 +474,11 @@ class MemoryMonitor:
                 if v is None:
                     continue
                 v_readable = int(v) * _KILOBYTE / _GIGABYTE
-                system_mem[k] += v_readable
-                # For swap, add "free" to "available"
-                if curr_mem["source"] == "Swap:" and k == "free":
-                    system_mem["available"] += v_readable
+                # swap is kept separate so it does not count as available RAM
+                if curr_mem["source"] == "Swap:":
+                    system_mem["swap_{}".format(k)] += v_readable
+                else:
+                    system_mem[k] += v_readable
         return system_mem
 
     def fetch_total_cpu(self):
@@ -440,11 +508,25 @@ class MemoryMonitor:
             try:
                 # process exists, update
                 process = self.processes[pgid]
-                process.update(record["cputime"], record["memory"])
+                process.update(
+                    record["cputime"],
+                    record["memory"],
+                    swap=record["swap"],
+                    anon=record["anon"],
+                    file=record["file"],
+                    shmem=record["shmem"],
+                )
             except KeyError:
                 # new process
                 process = ProcessGroup(
-                    pgid, record["user"], record["cputime"], record["memory"]
+                    pgid,
+                    record["user"],
+                    record["cputime"],
+                    record["memory"],
+                    swap=record["swap"],
+                    anon=record["anon"],
+                    file=record["file"],
+                    shmem=record["shmem"],
                 )
                 self.processes[pgid] = process
             # check memory/runtime
@@ -456,9 +538,10 @@ class MemoryMonitor:
     def highest_usage_process(self):
         highest_usage = 0
         for pgid, process in self.processes.items():
-            if process.memory > highest_usage:
+            # rank by memory actually freed on termination
+            if process.anon_swap_memory > highest_usage:
                 highest_usage_process = process
-                highest_usage = process.memory
+                highest_usage = process.anon_swap_memory
         return highest_usage_process
 
     def check(self):
@@ -500,6 +583,12 @@ class MemoryMonitor:
             time,
             fmt(cpu, 2),
             fmt(1 - system_mem["free"] / system_mem["total"], 3),
+            fmt(
+                system_mem["swap_used"] / system_mem["swap_total"]
+                if system_mem["swap_total"] > 0
+                else 0,
+                3,
+            ),
         ]
         gpu_stats = self.fetch_gpu_stats()
         for i in range(_N_GPU):
@@ -537,6 +626,7 @@ class MemoryMonitor:
                 pgid=terminate_process.pgid,
                 memory=terminate_process.memory,
                 percentage=terminate_process.memory_percent,
+                swap=terminate_process.swap,
             )
         return warning
 